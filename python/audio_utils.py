@@ -0,0 +1,52 @@
+"""
+------------------------------------------------------------------------------
+POLIPHONE Code
+
+This code is provided in connection with the article:
+
+  "POLIPHONE: A Dataset for Smartphone Model Identification from Audio Recordings"
+  Davide Salvi, Daniele Ugo Leonzio, Antonio Giganti, Claudio Eutizi,
+  Sara Mandelli, Paolo Bestagini, and Stefano Tubaro.
+  IEEE Access, 2025. DOI: 10.1109/ACCESS.2025.3545152
+
+Copyright (c) 2025 by the authors. All rights reserved.
+
+Redistribution and use in source and binary forms, with or without 
+modification, are permitted for non-commercial research purposes provided 
+that the original authors and the source publication are credited appropriately.
+
+For any commercial use, please contact the copyright holders.
+
+This software is provided "as is" without any express or implied
+warranty.
+------------------------------------------------------------------------------
+"""
+
+import librosa
+import soundfile as sf
+
+
+def load_audio(path, sample_rate=None):
+    """
+    Load a mono audio signal, resampling it only if needed.
+
+    Args:
+        path (str): Path to the audio file.
+        sample_rate (int): Target sample rate (default: None, keep the native one).
+
+    Returns:
+        tuple: Audio signal (float32) and its sample rate.
+    """
+    try:
+        signal, sr = sf.read(path, dtype='float32', always_2d=False)
+    except RuntimeError:
+        # Fall back to librosa for formats not supported by libsndfile
+        return librosa.load(path, sr=sample_rate, mono=True)
+
+    if signal.ndim == 2:
+        signal = signal.mean(axis=1)
+    if sample_rate is not None and sr != sample_rate:
+        signal = librosa.resample(signal, orig_sr=sr, target_sr=sample_rate, res_type='soxr_hq')
+        sr = sample_rate
+
+    return signal, sr
@@ -22,13 +22,20 @@ warranty.
 ------------------------------------------------------------------------------
 """
 
+import math
 import os
 import numpy as np
 import librosa
-import matplotlib.pyplot as plt
+import scipy.fft
+import scipy.signal
+from functools import lru_cache, partial
 from glob import glob
+from multiprocessing import Pool
+from numpy.lib.stride_tricks import sliding_window_view
 from tqdm import tqdm
 
+from audio_utils import load_audio
+
 
 def nan_helper(array):
     """
@@ -40,14 +47,14 @@ def nan_helper(array):
     Returns:
         numpy array: Array with NaN values interpolated.
     """
-    nan_indices = np.isnan(array)
-    not_nan_indices = ~nan_indices
+    nan_mask = np.isnan(array)
+    if not nan_mask.any():
+        return array
 
-    array[nan_indices] = np.interp(
-        nan_indices.nonzero()[0],
-        not_nan_indices.nonzero()[0],
-        array[not_nan_indices]
-    )
+    nan_indices = np.flatnonzero(nan_mask)
+    not_nan_indices = np.flatnonzero(~nan_mask)
+
+    array[nan_indices] = np.interp(nan_indices, not_nan_indices, array[not_nan_indices])
 
     return array
 
@@ -61,7 +68,7 @@ def normalize_audio(sig, rms_level=0):
 
     # linear rms level and scaling factor
     r = 10**(rms_level / 10.0)
-    a = np.sqrt((len(sig) * r**2) / np.sum(sig**2))
+    a = math.sqrt((len(sig) * r**2) / float(np.dot(sig, sig)))
 
     # normalize
     y = sig * a
@@ -69,14 +76,189 @@ def normalize_audio(sig, rms_level=0):
     return y
 
 
+def preemphasis(sig, coef=0.97):
+    """
+    Apply a first-order pre-emphasis filter, y[n] = x[n] - coef * x[n-1].
+    Equivalent to librosa.effects.preemphasis, including its linear
+    extrapolation of the initial filter state.
+    Args:
+        - coef (float) : pre-emphasis coefficient.
+    """
+    y = sig.copy()
+    y[1:] -= coef * sig[:-1]
+    y[0] += 2 * sig[0] - sig[1]
+
+    return y
+
+
+@lru_cache(maxsize=None)
+def stft_window(win_length, n_fft):
+    """
+    Build the Hamming analysis window used by librosa.stft, centered and
+    zero-padded to n_fft samples. Cached, as it is the same for every signal.
+
+    Args:
+        win_length (int): Window length for STFT.
+        n_fft (int): Number of FFT components.
+
+    Returns:
+        numpy array: Analysis window of length n_fft (float32, read-only).
+    """
+    window = librosa.util.pad_center(scipy.signal.get_window('hamming', win_length), size=n_fft)
+    window = window.astype(np.float32)
+    window.setflags(write=False)
+
+    return window
+
+
+def torch_channel_responses(windows, n_fft, hop_length, win_length, threshold, torch_device):
+    """
+    Compute the channel responses of a batch of windowed segments with PyTorch.
+
+    Args:
+        windows (numpy array): Windowed segments, shape (num_windows, window_samples).
+        n_fft (int): Number of FFT components.
+        hop_length (int): Hop length for STFT.
+        win_length (int): Window length for STFT.
+        threshold (float): Threshold to truncate log power spectrogram values.
+        torch_device (str): PyTorch device to run on (e.g. 'cuda').
+
+    Returns:
+        numpy array: Channel responses, shape (num_windows, n_fft // 2 + 1).
+    """
+    import torch
+
+    segments = torch.from_numpy(np.ascontiguousarray(windows)).to(torch_device)
+
+    # Compute the Short-Time Fourier Transform (STFT) of all the segments
+    stft_result = torch.stft(
+        segments,
+        n_fft=n_fft,
+        hop_length=hop_length,
+        win_length=win_length,
+        window=torch.hamming_window(win_length, dtype=segments.dtype, device=torch_device),
+        center=True,
+        pad_mode='constant',
+        return_complex=True
+    )
+
+    # Compute the log-scaled spectrograms and apply the threshold
+    log_spectrograms = 20 * torch.log10(1e-9 + stft_result.abs())
+    kept = log_spectrograms <= threshold
+
+    # Compute the mean channel responses over the kept values only
+    channel_responses = (log_spectrograms * kept).sum(dim=-1) / kept.sum(dim=-1)
+
+    return channel_responses.cpu().numpy()
+
+
+def process_signal(
+        signal_path, output_folder,
+        signal_duration=4.0, overlap_fraction=0.2, threshold=0, sample_rate=16000,
+        n_fft=512, hop_length=256, win_length=512, rms_level=0, plot=False,
+        torch_device=None, use_pyfftw=False, fft_workers=-1
+):
+    """
+    Compute and save the channel responses of a single audio signal.
+
+    Args:
+        signal_path (str): Path to the input audio file.
+        output_folder (str): Path to save computed channel responses.
+        fft_workers (int): Number of threads used by each FFT (default: -1, i.e. all CPUs).
+        Remaining arguments are the same as in `compute_channel_responses`.
+
+    Returns:
+        None
+    """
+    if plot and torch_device is not None:
+        raise ValueError('Plotting is not supported when torch_device is set.')
+
+    # Load and preprocess the audio signal
+    signal, _ = load_audio(signal_path, sample_rate=sample_rate)
+    signal = normalize_audio(signal, rms_level=rms_level)
+    signal = preemphasis(signal).astype(np.float32, copy=False)
+
+    # Calculate window parameters
+    window_samples = int(signal_duration * sample_rate)
+    overlap_samples = int(overlap_fraction * sample_rate)
+    step_size = window_samples - overlap_samples
+
+    num_windows = (len(signal) - overlap_samples) // step_size
+    if num_windows <= 0:
+        return
+
+    # Extract all the windowed segments at once, shape (num_windows, window_samples)
+    windows = sliding_window_view(signal, window_samples)[::step_size][:num_windows]
+
+    if torch_device is not None:
+        channel_responses = torch_channel_responses(
+            windows, n_fft, hop_length, win_length, threshold, torch_device
+        )
+    else:
+        # Frame every segment as librosa.stft does (centered frames, zero padding),
+        # shape (num_windows, n_frames, n_fft)
+        windows = np.pad(windows, ((0, 0), (n_fft // 2, n_fft // 2)))
+        frames = sliding_window_view(windows, n_fft, axis=1)[:, ::hop_length]
+
+        # Compute the Short-Time Fourier Transform (STFT) of all the segments,
+        # in single precision (float32 frames give a complex64 spectrum)
+        if use_pyfftw:
+            import pyfftw.interfaces.cache
+            import pyfftw.interfaces.scipy_fft
+
+            # Keep the FFTW plans alive across the (identically shaped) FFTs
+            pyfftw.interfaces.cache.enable()
+            pyfftw.interfaces.cache.set_keepalive_time(300)
+            fft_backend = pyfftw.interfaces.scipy_fft
+        else:
+            fft_backend = 'scipy'
+
+        with scipy.fft.set_backend(fft_backend):
+            stft_result = scipy.fft.rfft(frames * stft_window(win_length, n_fft), n=n_fft, axis=-1, workers=fft_workers)
+
+        # Compute the log-scaled spectrograms, reusing a single buffer
+        log_spectrograms = np.abs(stft_result)
+        log_spectrograms += 1e-9
+        np.log10(log_spectrograms, out=log_spectrograms)
+        log_spectrograms *= 20
+
+        # Apply the threshold
+        kept = log_spectrograms <= threshold
+
+        # Optional plotting (matplotlib is only imported when needed)
+        if plot:
+            import matplotlib.pyplot as plt
+
+            for log_spectrogram in np.where(kept, log_spectrograms, np.nan):
+                plt.imshow(log_spectrogram.T, aspect='auto')
+                plt.colorbar()
+                plt.show()
+
+        # Compute the mean channel responses over the kept values only
+        log_spectrograms *= kept
+        with np.errstate(invalid='ignore'):
+            channel_responses = log_spectrograms.sum(axis=1) / kept.sum(axis=1, dtype=np.float32)
+
+    # Save all the responses of the signal with device and speaker-specific naming,
+    # one row per window
+    device = signal_path.split('/')[-3]
+    speaker = os.path.basename(signal_path).split('.')[0]
+    save_path = os.path.join(output_folder, f'{device}_{speaker}.npy')
+    np.save(save_path, channel_responses.astype(np.float32, copy=False))
+
+
 def compute_channel_responses(
         input_folder, output_folder,
         signal_duration=4.0, overlap_fraction=0.2, threshold=0, sample_rate=16000,
-        n_fft=512, hop_length=256, win_length=512, rms_level=0, plot=False
+        n_fft=512, hop_length=256, win_length=512, rms_level=0, plot=False,
+        num_workers=None, torch_device=None, use_pyfftw=False
 ):
     """
     Process a collection of audio signals to compute and save their channel responses.
 
+    The responses of each signal are saved as a single float32 array of shape
+    (num_windows, n_fft // 2 + 1) in `<output_folder>/<device>_<speaker>.npy`.
+
     Args:
         input_folder (str): Path to input folder containing audio files.
         output_folder (str): Path to save computed channel responses.
@@ -89,62 +271,60 @@ def compute_channel_responses(
         win_length (int): Window length for STFT (default: 512).
         rms_level (float): RMS level to normalize signals (default: 0 dB).
         plot (bool): Whether to plot individual spectrograms for debugging (default: False).
+            Plotting forces sequential processing in the main process.
+        num_workers (int): Number of worker processes (default: None, i.e. all CPUs).
+        torch_device (str): If given, compute the STFTs with PyTorch on this device
+            (e.g. 'cuda') in the main process (default: None, i.e. NumPy/SciPy).
+            Plotting is not supported in this mode.
+        use_pyfftw (bool): Whether to compute the FFTs with pyFFTW, reusing cached FFTW
+            plans, instead of SciPy's pocketfft (default: False).
 
     Returns:
         None
     """
+    if plot and torch_device is not None:
+        raise ValueError('Plotting is not supported when torch_device is set.')
+
     # Get list of input audio paths
     signal_paths = glob(input_folder)
 
-    for signal_path in tqdm(signal_paths, total=len(signal_paths)):
-        # Load and preprocess the audio signal
-        signal, _ = librosa.load(signal_path, sr=sample_rate, mono=True)
-        signal = normalize_audio(signal, rms_level=rms_level)
-        signal = librosa.effects.preemphasis(signal)
-
-        # Calculate window parameters
-        window_samples = int(signal_duration * sample_rate)
-        overlap_samples = int(overlap_fraction * sample_rate)
-        step_size = window_samples - overlap_samples
-
-        num_windows = (len(signal) - overlap_samples) // step_size
-
-        for window_idx in range(num_windows):
-            # Extract the windowed segment
-            start = window_idx * step_size
-            end = start + window_samples
-            windowed_signal = signal[start:end]
-
-            # Compute the Short-Time Fourier Transform (STFT)
-            stft_result = librosa.stft(
-                windowed_signal,
-                n_fft=n_fft,
-                hop_length=hop_length,
-                win_length=win_length,
-                window='hamming'
-            )
-
-            # Compute the log-scaled spectrogram
-            log_spectrogram = 20 * np.log10(1e-9 + np.abs(stft_result))
-
-            # Apply the threshold
-            log_spectrogram[log_spectrogram > threshold] = np.nan
-
-            # Optional plotting
-            if plot:
-                plt.imshow(log_spectrogram, aspect='auto')
-                plt.colorbar()
-                plt.show()
-
-            # Compute the mean channel response, ignoring NaNs
-            channel_response = np.nanmean(log_spectrogram, axis=1)
+    # Create the output folder once, before dispatching the workers
+    os.makedirs(output_folder, exist_ok=True)
+
+    # Debug plotting and PyTorch devices require the main process, where the FFTs
+    # can use all CPUs; otherwise split the CPUs between the worker processes
+    sequential = plot or torch_device is not None
+    num_processes = num_workers or os.cpu_count()
+    fft_workers = -1 if sequential else max(1, os.cpu_count() // num_processes)
+
+    process = partial(
+        process_signal,
+        output_folder=output_folder,
+        signal_duration=signal_duration,
+        overlap_fraction=overlap_fraction,
+        threshold=threshold,
+        sample_rate=sample_rate,
+        n_fft=n_fft,
+        hop_length=hop_length,
+        win_length=win_length,
+        rms_level=rms_level,
+        plot=plot,
+        torch_device=torch_device,
+        use_pyfftw=use_pyfftw,
+        fft_workers=fft_workers
+    )
 
-            # Save the response with device and speaker-specific naming
-            device = signal_path.split('/')[-3]
-            speaker = os.path.basename(signal_path).split('.')[0]
-            save_path = os.path.join(output_folder, f'{device}_{speaker}_win_{window_idx}.npy')
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            np.save(save_path, channel_response)
+    if sequential:
+        for signal_path in tqdm(signal_paths, total=len(signal_paths)):
+            process(signal_path)
+        return
+
+    # Each file is independent: process them in parallel, in completion order
+    # Small chunks keep every worker busy, as each file is a heavy job
+    chunksize = max(1, len(signal_paths) // (4 * num_processes))
+    with Pool(processes=num_processes) as pool:
+        for _ in tqdm(pool.imap_unordered(process, signal_paths, chunksize=chunksize), total=len(signal_paths)):
+            pass
 
 
 if __name__ == '__main__':
@@ -22,11 +22,15 @@ warranty.
 ------------------------------------------------------------------------------
 """
 
-import librosa
+import math
+
 import matplotlib.pyplot as plt
 import numpy as np
 import scipy
 import scipy.io
+import scipy.signal
+
+from audio_utils import load_audio
 
 
 def normalize(signal, rms_level=0):
@@ -41,10 +45,31 @@ def normalize(signal, rms_level=0):
         numpy array: Normalized signal.
     """
     linear_rms = 10 ** (rms_level / 10.0)
-    scaling_factor = np.sqrt((len(signal) * linear_rms ** 2) / np.sum(signal ** 2))
+    scaling_factor = math.sqrt((len(signal) * linear_rms ** 2) / float(np.dot(signal, signal)))
     return signal * scaling_factor
 
 
+def deconvolve_sweep(sweep_fft, inv_sweep_fft):
+    """
+    Deconvolve sweep response spectra and split the resulting IRs.
+
+    Args:
+        sweep_fft (numpy array): FFTs of the sweep responses along the last axis.
+        inv_sweep_fft (numpy array): FFT of the inverse sweep.
+
+    Returns:
+        tuple: Linear IR and Non-linear IR components, one column per sweep response.
+    """
+    # Convolution in the frequency domain
+    ir = np.real(scipy.fft.ifft(inv_sweep_fft * sweep_fft, axis=-1, workers=-1))
+    ir = np.fft.fftshift(ir, axes=-1).T
+
+    ir_lin = ir[len(ir) // 2:]
+    ir_non_lin = ir[:len(ir) // 2]
+
+    return ir_lin, ir_non_lin
+
+
 def extract_ir_sweep(sweep_response, inv_sweep_fft):
     """
     Extract the impulse response (IR) from a sweep response signal.
@@ -60,16 +85,33 @@ def extract_ir_sweep(sweep_response, inv_sweep_fft):
         sweep_response = sweep_response.T
 
     fft_size = inv_sweep_fft.shape[1]
-    sweep_fft = scipy.fft.fft(sweep_response, fft_size)
+    sweep_fft = scipy.fft.fft(sweep_response, fft_size, workers=-1)
 
-    # Convolution in the frequency domain
-    ir = np.real(scipy.fft.ifft(inv_sweep_fft * sweep_fft))
-    ir = np.roll(ir.T, ir.shape[1] // 2)
+    return deconvolve_sweep(sweep_fft, inv_sweep_fft)
 
-    ir_lin = ir[len(ir) // 2:]
-    ir_non_lin = ir[:len(ir) // 2]
 
-    return ir_lin, ir_non_lin
+def extract_ir_sweep_batch(sweep_responses, inv_sweep_fft):
+    """
+    Extract the impulse responses (IRs) from several sweep response signals at once.
+
+    Args:
+        sweep_responses (list of numpy arrays): Recorded 1D sweep responses, one per device.
+        inv_sweep_fft (numpy array): FFT of the inverse sweep.
+
+    Returns:
+        tuple: Linear IRs and Non-linear IRs components, one column per sweep response.
+    """
+    fft_size = inv_sweep_fft.shape[1]
+
+    # Stack the sweep responses, zero-padded or truncated to the FFT size
+    sweep_batch = np.zeros((len(sweep_responses), fft_size), dtype=np.float32)
+    for i, sweep_response in enumerate(sweep_responses):
+        length = min(len(sweep_response), fft_size)
+        sweep_batch[i, :length] = sweep_response[:length]
+
+    sweep_fft = scipy.fft.fft(sweep_batch, axis=1, workers=-1)
+
+    return deconvolve_sweep(sweep_fft, inv_sweep_fft.astype(np.complex64))
 
 
 def nmse_error(signal, reference_signal):
@@ -88,6 +130,44 @@ def nmse_error(signal, reference_signal):
     return np.mean((signal - reference_signal) ** 2) / np.mean((reference_signal - np.mean(reference_signal)) ** 2)
 
 
+def shifted_nmse_errors(signal, reference_signal, max_shift=200):
+    """
+    Calculate the NMSE between a reference signal and all the shifted versions of a signal.
+
+    For each shift in [-max_shift, max_shift), this is equivalent to
+    nmse_error(signal[max_shift + shift: -max_shift + shift], reference_signal[max_shift: -max_shift]),
+    with the cross term computed at once as an FFT-based cross-correlation.
+
+    Args:
+        signal (numpy array): Input signal for comparison.
+        reference_signal (numpy array): Reference signal to compare against.
+        max_shift (int): Maximum shift in samples (default: 200).
+
+    Returns:
+        numpy array: Normalized mean squared error for each shift.
+    """
+    num_shifts = 2 * max_shift
+    if len(signal) != len(reference_signal) or len(signal) <= num_shifts:
+        return np.zeros(num_shifts)
+
+    a = np.asarray(signal, dtype=np.float64)
+    b = np.asarray(reference_signal[max_shift: -max_shift], dtype=np.float64)
+    length = len(b)
+
+    # Energy of every shifted segment of the signal
+    cumulative_energy = np.concatenate(([0.0], np.cumsum(a * a)))
+    sum_a2 = cumulative_energy[length:length + num_shifts] - cumulative_energy[:num_shifts]
+
+    # Cross-correlation between the shifted segments and the reference
+    xcorr = scipy.signal.fftconvolve(a, b[::-1], mode='valid')[:num_shifts]
+
+    sum_b2 = np.dot(b, b)
+    mse = np.maximum(sum_a2 - 2 * xcorr + sum_b2, 0) / length
+    variance = sum_b2 / length - (np.sum(b) / length) ** 2
+
+    return mse / variance
+
+
 def process_device_signals(
         sweep_path,
         original_speech_path,
@@ -121,15 +201,15 @@ def process_device_signals(
         tuple: Two lists - NMSE mean values and slope values for all analysis windows.
     """
     # Load recorded sweep and extract IR
-    sweep_signal, fs = librosa.load(sweep_path, sr=sample_rate)
+    sweep_signal, fs = load_audio(sweep_path, sample_rate=sample_rate)
     ir_lin, _ = extract_ir_sweep(sweep_signal, inv_sweep_fft)
 
     # Load original speech and device-recorded speech
-    speech_original, _ = librosa.load(original_speech_path, sr=sample_rate)
-    speech_device, _ = librosa.load(device_speech_path, sr=sample_rate)
+    speech_original, _ = load_audio(original_speech_path, sample_rate=sample_rate)
+    speech_device, _ = load_audio(device_speech_path, sample_rate=sample_rate)
 
     # Convolve the original signal with the linear IR
-    speech_reconstructed = np.convolve(speech_original, ir_lin[3000:6000, 0], mode='same')
+    speech_reconstructed = scipy.signal.oaconvolve(speech_original, ir_lin[3000:6000, 0], mode='same')
 
     # Adjust device-reconstructed speech based on the given margin
     speech_device_mod = speech_device[margin:]
@@ -139,6 +219,8 @@ def process_device_signals(
     win_len = int(window_duration * fs)
     num_windows = len(speech_device_mod) // win_len
     err_min_all, err_pos_all = [], []
+    max_shift = 200
+    shifts = np.arange(-max_shift, max_shift)
 
     for i in range(num_windows):
         start = i * win_len
@@ -146,20 +228,13 @@ def process_device_signals(
         win_device = speech_device_mod[start:end]
         win_reconstructed = speech_reconstructed_mod[start:end]
 
-        err_list, shifts = [], np.arange(-200, 200)
-
         # Compute error for shifted windows
-        for shift in shifts:
-            err = nmse_error(
-                win_reconstructed[200 + shift: -200 + shift],
-                win_device[200: -200]
-            )
-            err_list.append(err)
-
-        # Find minimum error and optimal shift
-        errors = 10 * np.log10(err_list)  # Convert to dB
-        err_min_all.append(np.min(errors))
-        err_pos_all.append(shifts[np.argmin(errors)])
+        errors = shifted_nmse_errors(win_reconstructed, win_device, max_shift=max_shift)
+
+        # Find minimum error and optimal shift (the dB conversion is monotonic)
+        best = np.argmin(errors)
+        err_min_all.append(10 * np.log10(errors[best]))  # Convert to dB
+        err_pos_all.append(shifts[best])
 
     # Calculate slope for all shifts across windows
     slope = (err_pos_all[-1] - err_pos_all[0]) / len(err_pos_all)